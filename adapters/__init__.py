@@ -1,5 +1,24 @@
-from .python_adapter import PythonAdapter
-from .csharp_adapter import CsAdapter
-from .java_adapter import JavaAdapter
+import importlib
+
+# adapters importados sob demanda: carregar um não importa os demais
+_ADAPTER_MODULES = {
+    "PythonAdapter": ".python_adapter",
+    "CsAdapter": ".csharp_adapter",
+    "JavaAdapter": ".java_adapter",
+}
 
 __all__ = ["PythonAdapter", "CsAdapter", "JavaAdapter"]
+
+
+def __getattr__(name: str):
+    module_name = _ADAPTER_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    adapter = getattr(importlib.import_module(module_name, __name__), name)
+    # guarda no módulo para que os próximos acessos não passem por aqui
+    globals()[name] = adapter
+    return adapter
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
@@ -1,11 +1,30 @@
 import asyncio
+import json
 from abc import ABC, abstractmethod
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator
+from xml.sax.saxutils import escape
 
 from llm.engines import LLMEngine
 
+# o esquema do relatório é fixo: o XML é montado a partir deste modelo
+_REPORT_TMPL = (
+    "<test_report>"
+    "<timestamp>{ts}</timestamp>"
+    "<project_path>{pp}</project_path>"
+    "<language>{lang}</language>"
+    "<return_code>{rc}</return_code>"
+    "<output>{out}</output>"
+    "{summary}"
+    "<status>{st}</status>"
+    "</test_report>"
+)
+
+# decodifica um valor JSON no meio do texto (raw_decode), sem exigir que a
+# resposta inteira seja JSON
+_JSON_DECODER = json.JSONDecoder()
+
 
 class LanguageAdapter(ABC):
     """Classe base para adapters de linguagens de programação."""
@@ -15,9 +34,15 @@ class LanguageAdapter(ABC):
     def __init__(
         self,
         llm_engine: LLMEngine,
+        marshal_batches: bool = False,
     ):
         self.llm = llm_engine
+        # agrupa vários códigos do lote em cada requisição à LLM
+        self.marshal_batches = marshal_batches
         self.project_path: Path | None = None
+        # forma textual de project_path, definida em init_project (opcional:
+        # adapters que não a definem usam str(project_path))
+        self._project_path_str: str | None = None
 
     @abstractmethod
     def init_project(self, work_dir: Path) -> dict[str, Path]:
@@ -44,48 +69,211 @@ class LanguageAdapter(ABC):
         """Prepara código de teste e retorna (código_preparado, nome_arquivo)."""
         pass
 
-    async def _process_test_generation_batch(
-        self, input_code: str | list[str]
-    ) -> list[str]:
-        """Processa múltiplos códigos de entrada de forma assíncrona."""
+    @abstractmethod
+    def _extract_test_code(self, response: Any) -> str:
+        """Extrai o código de teste da resposta da LLM."""
+        pass
+
+    async def _generate_single_test_async(self, code: str) -> str:
+        """Versão assíncrona de _generate_single_test.
+
+        Usa o cliente assíncrono da LLM e extrai o código com
+        `_extract_test_code`.
+        """
+        response = await self.llm.send_message_async(content=code)
+        return self._extract_test_code(response)
+
+    def _config_key(self) -> str:
+        """Descreve a classe e as opções do adapter que mudam o resultado.
+
+        Faz parte da chave que decide se o pipeline pode reaproveitar a última
+        execução; adapters com opções próprias devem estendê-la.
+        """
+        cls = type(self)
+        name = f"{cls.__module__}.{cls.__qualname__}"
+        return f"{name}:marshal_batches={self.marshal_batches}"
+
+    def cleanup(self) -> None:
+        """Encerra processos auxiliares iniciados pelo adapter.
+
+        Chamado pelo pipeline ao final da execução, inclusive em caso de erro.
+        Por padrão não faz nada.
+        """
+
+    async def execute_tests_async(self) -> dict[str, Any]:
+        """Versão assíncrona de execute_tests.
+
+        Executa os testes em uma thread, sem bloquear o event loop enquanto o
+        subprocesso do runner roda.
+        """
+        return await asyncio.to_thread(self.execute_tests)
+
+    async def _process_test_generation_batch(self, input_code: list[str]) -> list[str]:
+        """Gera os testes do lote pelo envio em lote da LLM (ordem preservada).
+
+        Com `marshal_batches`, vários códigos vão em cada requisição; os que
+        faltarem na resposta são gerados individualmente.
+        """
+        tests: list[str | None] = [None] * len(input_code)
+        if self.marshal_batches and len(input_code) > 1:
+            tests = await self._generate_tests_marshaled(input_code)
+
+        missing = [i for i, test_code in enumerate(tests) if test_code is None]
+        responses = await self.llm.send_batch_async([input_code[i] for i in missing])
+        for i, response in zip(missing, responses):
+            tests[i] = self._extract_test_code(response)
+        return tests
+
+    def _batch_is_atomic(self, count: int) -> bool:
+        """Indica se um lote de `count` códigos só fica pronto de uma vez
+        (ex.: requisições agrupadas ou lote offline da LLM), e não teste a
+        teste.
+        """
+        if self.marshal_batches and count > 1:
+            return True
+        return self.llm.prefers_offline_batch(count)
+
+    async def _generate_tests_marshaled(
+        self, input_code: list[str]
+    ) -> list[str | None]:
+        """Gera os testes do lote agrupando vários códigos por requisição.
+
+        Retorna None para os códigos ausentes na resposta da LLM.
+        """
+        replies = await self.llm.send_marshaled_async(input_code)
+        return [
+            None if reply is None else self._extract_test_code(reply)
+            for reply in replies
+        ]
+
+    async def agenerate_tests_stream(
+        self, input_code: list[str]
+    ) -> AsyncIterator[tuple[int, str]]:
+        """Gera testes para o lote, entregando (índice, código) à medida que
+        cada um fica pronto.
+
+        Se o lote for gerado de uma vez (ver `_batch_is_atomic`), os testes
+        só ficam prontos ao final e são entregues juntos.
+        """
+        if self._batch_is_atomic(len(input_code)):
+            tests = await self._process_test_generation_batch(input_code)
+            for item in enumerate(tests):
+                yield item
+            return
+
+        async def indexed(index: int, code: str) -> tuple[int, str]:
+            return index, await self._generate_single_test_async(code)
+
         tasks = [
-            asyncio.to_thread(self._generate_single_test, code) for code in input_code
+            asyncio.ensure_future(indexed(i, code)) for i, code in enumerate(input_code)
         ]
-        return await asyncio.gather(*tasks)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # em caso de erro (ou iteração interrompida) cancela o restante
+            for task in tasks:
+                task.cancel()
+
+    async def agenerate_tests(self, input_code: str | list[str]) -> str | list[str]:
+        """Gera testes para o código de entrada de forma assíncrona.
+
+        Deve ser usado diretamente quando já existe um event loop em execução
+        (ex.: Jupyter): `await adapter.agenerate_tests(...)`.
+        """
+        if isinstance(input_code, list):
+            return await self._process_test_generation_batch(input_code)
+        return await self._generate_single_test_async(input_code)
+
+    async def _agenerate_tests_and_close(self, input_code: list[str]) -> list[str]:
+        """Gera o lote e libera as conexões da LLM deste event loop."""
+        try:
+            return await self.agenerate_tests(input_code)
+        finally:
+            await self.llm.aclose()
 
     def generate_tests(self, input_code: str | list[str]) -> str | list[str]:
         """Gera testes para o código de entrada."""
+        # entrada única: chamada síncrona direta, sem criar um event loop
+        if not isinstance(input_code, list):
+            return self._generate_single_test(input_code)
+        if len(input_code) == 1:
+            return [self._generate_single_test(input_code[0])]
 
-        if isinstance(input_code, list):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._agenerate_tests_and_close(input_code))
+
+        raise RuntimeError(
+            "generate_tests cannot run inside an event loop; "
+            "use 'await agenerate_tests(...)' instead."
+        )
+
+    @staticmethod
+    def _parse_json_code(text_content: str) -> str | None:
+        """Lê o código de teste da resposta em JSON ({"code": "..."}).
+
+        Aceita o objeto cercado de texto ou dentro de um bloco ```json: tenta
+        decodificar um objeto a partir de cada "{" até achar um com "code" em
+        texto. Retorna None se a resposta não contiver o objeto esperado.
+        """
+        start = text_content.find("{")
+        while start >= 0:
             try:
-                asyncio.get_running_loop()
-            except RuntimeError:
-                # No event loop running, use asyncio.run()
-                return asyncio.run(self._process_test_generation_batch(input_code))
+                data, _ = _JSON_DECODER.raw_decode(text_content, start)
+            except ValueError:
+                pass
             else:
-                # Event loop already running (e.g., in Jupyter), use nest_asyncio
-                import nest_asyncio
+                code = data.get("code") if isinstance(data, dict) else None
+                if isinstance(code, str):
+                    return code
+            start = text_content.find("{", start + 1)
+        return None
 
-                nest_asyncio.apply()
-                return asyncio.run(self._process_test_generation_batch(input_code))
-        else:
-            return self._generate_single_test(input_code)
+    @staticmethod
+    def _find_fenced_code(text_content: str, languages: frozenset[str]) -> str | None:
+        """Retorna o conteúdo do primeiro bloco markdown de uma das linguagens.
+
+        A linguagem vazia ("") aceita blocos sem linguagem. A busca usa apenas
+        str.find, sem regex; retorna None se nenhum bloco completo for achado.
+        """
+        fence = text_content.find("```")
+        while fence >= 0:
+            newline = text_content.find("\n", fence + 3)
+            if newline < 0:
+                return None
+            end = text_content.find("\n```", newline)
+            if end < 0:
+                return None
+            if text_content[fence + 3 : newline].strip().lower() in languages:
+                return text_content[newline + 1 : end]
+            # bloco de outra linguagem: continua após o fechamento dele
+            fence = text_content.find("```", end + 4)
+        return None
 
     def generate_report(self, test_results: dict[str, Any]) -> str:
         """Gera relatório XML dos resultados dos testes e retorna como string."""
-        import xml.etree.ElementTree as ET
-
         if not self.project_path:
             raise RuntimeError("Project not initialized. Call init_project first.")
 
-        root = ET.Element("test_report")
-        ET.SubElement(root, "timestamp").text = datetime.now().isoformat()
-        ET.SubElement(root, "project_path").text = str(self.project_path)
-        ET.SubElement(root, "language").text = self.language
-        ET.SubElement(root, "return_code").text = str(test_results["return_code"])
-        ET.SubElement(root, "output").text = test_results["stdout"]
-        ET.SubElement(root, "status").text = (
-            "passed" if test_results["return_code"] == 0 else "failed"
-        )
+        rc = test_results["return_code"]
+        stdout = test_results["stdout"]
+        status = "passed" if rc == 0 else "failed"
 
-        return ET.tostring(root, encoding="unicode", xml_declaration=False)
+        # resumo opcional da contagem de testes (ex.: passed/failed/total)
+        summary = test_results.get("summary")
+        summary_xml = ""
+        if summary:
+            attrs = " ".join(f'{key}="{value}"' for key, value in summary.items())
+            summary_xml = f"<summary {attrs}/>"
+
+        return _REPORT_TMPL.format(
+            ts=datetime.now().isoformat(),
+            pp=escape(self._project_path_str or str(self.project_path)),
+            lang=self.language,
+            rc=rc,
+            out=escape(stdout),
+            summary=summary_xml,
+            st=status,
+        )
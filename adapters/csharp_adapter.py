@@ -1,51 +1,36 @@
+import asyncio
+import functools
 import re
 import subprocess
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
 from adapters.base import LanguageAdapter
 
+# linguagens aceitas nos blocos de código markdown da resposta da LLM ("" = sem linguagem)
+_CS_FENCE_LANGS = frozenset({"csharp", "cs", "c#", ""})
 
-class CsAdapter(LanguageAdapter):
-    """Adapter para projetos C#."""
-
-    language = "csharp"
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.project_path: Path | None = None
-        self.source_path: Path | None = None
-        self.tests_path: Path | None = None
+# linha de resumo do dotnet test, ex.:
+# "Passed!  - Failed:     0, Passed:     3, Skipped:     0, Total:     3, ..."
+_TEST_SUMMARY = re.compile(
+    rb"(?:Passed|Failed)!\s+-\s+Failed:\s+(\d+),\s+Passed:\s+(\d+),"
+    rb"\s+Skipped:\s+(\d+),\s+Total:\s+(\d+)"
+)
 
-    def init_project(self, work_dir: Path) -> dict[str, Path]:
-        """Cria estrutura do projeto C# com arquivos .csproj e diretórios src e tests."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        project_name = f"cs_project_{timestamp}"
-
-        # cria os diretórios
-        self.project_path = work_dir / project_name
-        self.project_path.mkdir(parents=True, exist_ok=True)
-
-        self.source_path = self.project_path / "src"
-        self.source_path.mkdir(exist_ok=True)
-
-        self.tests_path = self.project_path / "tests"
-        self.tests_path.mkdir(exist_ok=True)
+# número de linhas finais da saída do dotnet test mantidas no resultado
+_OUTPUT_TAIL_LINES = 500
 
-        # cria arquivo de projeto .csproj para a aplicação
-        app_csproj_content = """<Project Sdk="Microsoft.NET.Sdk">
+# arquivos de projeto da aplicação e dos testes (já codificados)
+_APP_CSPROJ = b"""<Project Sdk="Microsoft.NET.Sdk">
   <PropertyGroup>
     <TargetFramework>net8.0</TargetFramework>
     <Nullable>enable</Nullable>
   </PropertyGroup>
 </Project>"""
 
-        with open(self.source_path / "App.csproj", "w") as f:
-            f.write(app_csproj_content)
-
-        # cria arquivo de projeto .csproj para os testes
-        test_csproj_content = """<Project Sdk="Microsoft.NET.Sdk">
+_TEST_CSPROJ = b"""<Project Sdk="Microsoft.NET.Sdk">
   <PropertyGroup>
     <TargetFramework>net8.0</TargetFramework>
     <Nullable>enable</Nullable>
@@ -67,8 +52,60 @@ class CsAdapter(LanguageAdapter):
   </ItemGroup>
 </Project>"""
 
-        with open(self.tests_path / "Tests.csproj", "w") as f:
-            f.write(test_csproj_content)
+
+class CsAdapter(LanguageAdapter):
+    """Adapter para projetos C#.
+
+    O tempo de uma execução é dominado pelas chamadas à LLM e pelo
+    `dotnet restore`/`dotnet test`, não por processamento em Python. Por isso,
+    com `fast=True` (padrão), o adapter sobrepõe E/S de rede e reduz chamadas
+    à LLM: geração assíncrona em lote com streaming e `dotnet restore` em
+    segundo plano desde `init_project`. O cache de respostas fica no engine.
+    Com `fast=False` o fluxo é sequencial e síncrono, mais simples de depurar.
+    """
+
+    language = "csharp"
+
+    def __init__(
+        self,
+        *args,
+        fast: bool = True,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.fast = fast
+        self.project_path: Path | None = None
+        self.source_path: Path | None = None
+        self.tests_path: Path | None = None
+        self._tests_path_str: str | None = None
+        self._restore_process: subprocess.Popen | None = None
+
+    def init_project(self, work_dir: Path) -> dict[str, Path]:
+        """Cria estrutura do projeto C# com arquivos .csproj e diretórios src e tests."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        project_name = f"cs_project_{timestamp}"
+
+        self.project_path = work_dir / project_name
+        self.source_path = self.project_path / "src"
+        self.tests_path = self.project_path / "tests"
+
+        # cria os diretórios; o do projeto é criado junto com o primeiro
+        self.source_path.mkdir(parents=True, exist_ok=True)
+        self.tests_path.mkdir(exist_ok=True)
+
+        # caminhos em texto reutilizados nos subprocessos e no relatório
+        self._project_path_str = str(self.project_path)
+        self._tests_path_str = str(self.tests_path)
+
+        # cria os arquivos .csproj da aplicação e dos testes
+        _write_if_changed(self.source_path / "App.csproj", _APP_CSPROJ)
+        _write_if_changed(self.tests_path / "Tests.csproj", _TEST_CSPROJ)
+
+        # o restore depende apenas dos .csproj: inicia em segundo plano para
+        # sobrepor o download de pacotes com a geração dos testes pela LLM
+        # (desnecessário se o projeto já foi restaurado com estes .csproj)
+        if self.fast and not self._restore_is_current():
+            self._restore_process = self._start_restore()
 
         return {
             "project_path": self.project_path,
@@ -80,43 +117,89 @@ class CsAdapter(LanguageAdapter):
         """Gera teste C# usando LLM e retorna o código como string."""
         # envia requisição à LLM injetado
         response = self.llm.send_message(content=code)
+        return self._extract_test_code(response)
+
+    async def _generate_single_test_async(self, code: str) -> str:
+        """Gera teste C# consumindo a resposta da LLM em streaming."""
+        if not self.fast:
+            return self._generate_single_test(code)
+
+        chunks = [chunk async for chunk in self.llm.stream_message(code)]
+        return self._extract_test_code("".join(chunks))
+
+    async def _process_test_generation_batch(self, input_code: list[str]) -> list[str]:
+        """Gera os testes de vários códigos agrupados em poucas chamadas à LLM.
 
+        Os códigos que não puderem ser extraídos da resposta em lote são
+        gerados individualmente.
+        """
+        if not self.fast:
+            return [self._generate_single_test(code) for code in input_code]
+
+        results: list[str | None] = [None] * len(input_code)
+        if len(input_code) > 1:
+            results = await self._generate_tests_marshaled(input_code)
+
+        # fallback: geração individual do que não veio na resposta em lote
+        missing = [i for i, result in enumerate(results) if result is None]
+        generated = await asyncio.gather(
+            *(self._generate_single_test_async(input_code[i]) for i in missing)
+        )
+        for i, test_code in zip(missing, generated):
+            results[i] = test_code
+
+        return results
+
+    def _batch_is_atomic(self, count: int) -> bool:
+        # a geração em lote agrupa os códigos por requisição (ou é sequencial,
+        # sem `fast`): os testes chegam juntos
+        return True
+
+    def _config_key(self) -> str:
+        return f"{super()._config_key()}:fast={self.fast}"
+
+    def _extract_test_code(self, response: Any) -> str:
+        """Extrai o código C# da resposta da LLM."""
         # busca o conteúdo de texto na resposta
         if isinstance(response, list) and len(response) > 0:
             text_content = response[0].text
         else:
             text_content = str(response)
 
-        # extrai o código C# (tenta diferentes formatos de markdown)
-        code_match = re.search(
-            r"```(?:csharp|cs|c#)\n(.*?)\n```", text_content, re.DOTALL | re.IGNORECASE
-        )
-        if code_match:
-            test_code = code_match.group(1)
-        else:
-            # tenta capturar blocos genéricos de código se não encontrou C# específico
-            generic_match = re.search(r"```\n(.*?)\n```", text_content, re.DOTALL)
-            if generic_match:
-                test_code = generic_match.group(1)
-            else:
+        # resposta estruturada em JSON; markdown como alternativa
+        test_code = self._parse_json_code(text_content)
+        if test_code is None:
+            # extrai o código C# (bloco da linguagem ou genérico, em uma só passada)
+            test_code = self._find_fenced_code(text_content, _CS_FENCE_LANGS)
+            if test_code is None:
                 test_code = text_content
 
         return test_code
 
     def prepare_source_code(self, code: str, index: int) -> tuple[str, str]:
         """Prepara código e retorna (código_preparado, nome_arquivo)."""
-        filename = f"Module_{index}.cs" if index > 0 else "Program.cs"
+        filename = _source_filename(index)
 
         # adiciona using System se necessário
-        if "using System;" not in code:
-            if not code.strip().startswith("using"):
-                code = "using System;\n\n" + code
+        if "using System;" in code:
+            return code, filename
+
+        # pula o espaço inicial sem copiar o código e verifica se há um using
+        start = 0
+        while start < len(code) and code[start] in " \t\r\n":
+            start += 1
+
+        if code.startswith("using ", start):
+            # insere junto às diretivas using já existentes
+            code = "using System;\n" + code
+        else:
+            code = "using System;\n\n" + code
 
         return code, filename
 
     def prepare_test_code(self, test_code: str, index: int) -> tuple[str, str]:
         """Prepara código de teste C# e retorna (código, nome_arquivo)."""
-        filename = f"Module_{index}Tests.cs" if index > 0 else "UnitTests.cs"
+        filename = _test_filename(index)
         return test_code, filename
 
     def execute_tests(self) -> dict[str, Any]:
@@ -124,33 +207,111 @@ class CsAdapter(LanguageAdapter):
         if not self.tests_path:
             raise RuntimeError("Project not initialized. Call init_project first.")
 
-        # primeiro, restaura as dependências
-        restore_cmd = ["dotnet", "restore"]
-        restore_process = subprocess.run(
-            restore_cmd,
-            cwd=str(self.tests_path),
+        # aguarda o restore iniciado em init_project; sem ele, restaura apenas
+        # se os .csproj mudaram desde o último restore do mesmo projeto
+        restore_process = self._restore_process
+        self._restore_process = None
+        if restore_process is None and not self._restore_is_current():
+            restore_process = self._start_restore()
+
+        if restore_process is not None:
+            restore_output, _ = restore_process.communicate()
+            if restore_process.returncode != 0:
+                return {
+                    "return_code": restore_process.returncode,
+                    "stdout": restore_output.decode("utf-8", errors="replace"),
+                }
+
+        # executa os testes lendo a saída linha a linha: mantém apenas as
+        # últimas linhas e acumula o resumo de cada assembly de testes
+        test_cmd = ["dotnet", "test", "--verbosity", "minimal", "--no-restore"]
+        test_process = subprocess.Popen(
+            test_cmd,
+            cwd=self._tests_path_str,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
         )
 
-        if restore_process.returncode != 0:
-            return {
-                "return_code": restore_process.returncode,
-                "stdout": restore_process.stdout,
-            }
+        tail: deque[bytes] = deque(maxlen=_OUTPUT_TAIL_LINES)
+        summary = {"passed": 0, "failed": 0, "skipped": 0, "total": 0}
+        summary_found = False
+        line_count = 0
+        for line in test_process.stdout:
+            line_count += 1
+            tail.append(line)
+            summary_match = _TEST_SUMMARY.search(line)
+            if summary_match:
+                summary_found = True
+                failed, passed, skipped, total = map(int, summary_match.groups())
+                summary["failed"] += failed
+                summary["passed"] += passed
+                summary["skipped"] += skipped
+                summary["total"] += total
 
-        # executa os testes
-        test_cmd = ["dotnet", "test", "--verbosity", "minimal", "--no-restore"]
-        test_process = subprocess.run(
-            test_cmd,
-            cwd=str(self.tests_path),
+        rc = test_process.wait()
+        stdout = b"".join(tail).decode("utf-8", errors="replace")
+        if line_count > len(tail):
+            omitted = line_count - len(tail)
+            stdout = f"... ({omitted} linhas omitidas)\n" + stdout
+
+        results = {"return_code": rc, "stdout": stdout}
+        # sem linha de resumo (ex.: falha de build) não há contagem a relatar
+        if summary_found:
+            results["summary"] = summary
+        return results
+
+    def cleanup(self) -> None:
+        """Encerra o restore em segundo plano que não chegou a ser aguardado."""
+        restore_process = self._restore_process
+        self._restore_process = None
+        if restore_process is not None:
+            restore_process.kill()
+            restore_process.communicate()
+
+    def _restore_is_current(self) -> bool:
+        """Indica se o último restore é mais novo que os dois .csproj."""
+        try:
+            return all(
+                (path / "obj" / "project.assets.json").stat().st_mtime
+                >= (path / csproj).stat().st_mtime
+                for path, csproj in (
+                    (self.source_path, "App.csproj"),
+                    (self.tests_path, "Tests.csproj"),
+                )
+            )
+        except FileNotFoundError:
+            return False
+
+    def _start_restore(self) -> subprocess.Popen:
+        """Inicia `dotnet restore` no projeto de testes sem aguardar o término."""
+        return subprocess.Popen(
+            ["dotnet", "restore"],
+            cwd=self._tests_path_str,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
         )
 
-        rc = test_process.returncode
-        stdout = test_process.stdout
 
-        return {"return_code": rc, "stdout": stdout}
+@functools.lru_cache(maxsize=256)
+def _source_filename(index: int) -> str:
+    """Nome do arquivo de código fonte para o índice informado."""
+    return f"Module_{index}.cs" if index > 0 else "Program.cs"
+
+
+@functools.lru_cache(maxsize=256)
+def _test_filename(index: int) -> str:
+    """Nome do arquivo de teste para o índice informado."""
+    return f"Module_{index}Tests.cs" if index > 0 else "UnitTests.cs"
+
+
+def _write_if_changed(path: Path, data: bytes) -> None:
+    """Grava o arquivo apenas se o conteúdo em disco for diferente.
+
+    Evita alterar o mtime dos .csproj, o que invalidaria o build incremental.
+    """
+    try:
+        if path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
@@ -1,37 +1,83 @@
+import os
 import re
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
 from adapters.base import LanguageAdapter
 
+# linguagens aceitas nos blocos de código markdown da resposta da LLM ("" = sem linguagem)
+_JAVA_FENCE_LANGS = frozenset({"java", ""})
+
+# declaração da classe pública, que define o nome do arquivo
+_PUBLIC_CLASS = re.compile(r"public\s+class\s+(\w+)")
+
+# executor que roda o main de todas as classes de teste em uma única JVM;
+# para na primeira classe que falhar, como a execução classe a classe
+_RUNNER_CLASS = "TestLabRunner"
+_RUNNER_DONE = "=== TestLabRunner: done ==="
+_RUNNER_SOURCE = b"""public class TestLabRunner {
+    public static void main(String[] args) throws Exception {
+        for (String name : args) {
+            System.out.println("=== " + name + " ===");
+            try {
+                Class.forName(name)
+                    .getMethod("main", String[].class)
+                    .invoke(null, (Object) new String[0]);
+            } catch (java.lang.reflect.InvocationTargetException e) {
+                e.getCause().printStackTrace(System.out);
+                System.exit(1);
+            }
+        }
+        System.out.println("=== TestLabRunner: done ===");
+    }
+}
+"""
+
 
 class JavaAdapter(LanguageAdapter):
     """Adapter para projetos Java."""
 
     language = "java"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        split_compile: bool = False,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        # compila fontes e testes em etapas separadas (erros isolados por etapa)
+        self.split_compile = split_compile
         self.project_path: Path | None = None
         self.source_path: Path | None = None
         self.tests_path: Path | None = None
+        # arquivos preparados pelo adapter (nome -> caminho), evitando
+        # varrer os diretórios na execução
+        self._src_files: dict[str, Path] = {}
+        self._test_files: dict[str, Path] = {}
 
     def init_project(self, work_dir: Path) -> dict[str, Path]:
         """Cria estrutura do projeto com diretórios src e tests."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         project_name = f"java_project_{timestamp}"
 
-        # cria os diretórios
         self.project_path = work_dir / project_name
-        self.project_path.mkdir(parents=True, exist_ok=True)
-
         self.source_path = self.project_path / "src"
-        self.source_path.mkdir(exist_ok=True)
-
         self.tests_path = self.project_path / "tests"
+
+        # cria os diretórios; o do projeto é criado junto com o primeiro
+        self.source_path.mkdir(parents=True, exist_ok=True)
         self.tests_path.mkdir(exist_ok=True)
+        (self.project_path / "bin").mkdir(exist_ok=True)
+        (self.project_path / "runner").mkdir(exist_ok=True)
+
+        # caminhos em texto reutilizados nos subprocessos e no relatório
+        self._project_path_str = str(self.project_path)
+        self._src_files = {}
+        self._test_files = {}
 
         return {
             "project_path": self.project_path,
@@ -43,25 +89,25 @@ class JavaAdapter(LanguageAdapter):
         """Gera teste usando LLM e retorna o código como string."""
         # envia requisição à LLM injetado
         response = self.llm.send_message(content=code)
+        return self._extract_test_code(response)
+
+    def _config_key(self) -> str:
+        return f"{super()._config_key()}:split_compile={self.split_compile}"
 
+    def _extract_test_code(self, response: Any) -> str:
+        """Extrai o código Java da resposta da LLM."""
         # busca o conteúdo de texto na resposta
         if isinstance(response, list) and len(response) > 0:
             text_content = response[0].text
         else:
             text_content = str(response)
 
-        # extrai o código Java (tenta diferentes formatos de markdown)
-        code_match = re.search(
-            r"```(?:java)\n(.*?)\n```", text_content, re.DOTALL | re.IGNORECASE
-        )
-        if code_match:
-            test_code = code_match.group(1)
-        else:
-            # tenta capturar blocos genéricos de código se não encontrou Java específico
-            generic_match = re.search(r"```\n(.*?)\n```", text_content, re.DOTALL)
-            if generic_match:
-                test_code = generic_match.group(1)
-            else:
+        # resposta estruturada em JSON; markdown como alternativa
+        test_code = self._parse_json_code(text_content)
+        if test_code is None:
+            # extrai o código Java (bloco da linguagem ou genérico, em uma só passada)
+            test_code = self._find_fenced_code(text_content, _JAVA_FENCE_LANGS)
+            if test_code is None:
                 test_code = text_content
 
         return test_code
@@ -69,9 +115,7 @@ class JavaAdapter(LanguageAdapter):
     def prepare_source_code(self, code: str, index: int) -> tuple[str, str]:
         """Prepara código e retorna (código_preparado, nome_arquivo)."""
         # extrai o nome da classe pública do código
-        import re
-
-        class_match = re.search(r"public\s+class\s+(\w+)", code)
+        class_match = _PUBLIC_CLASS.search(code)
         if class_match:
             class_name = class_match.group(1)
             filename = f"{class_name}.java"
@@ -79,14 +123,14 @@ class JavaAdapter(LanguageAdapter):
             # fallback se não encontrar uma classe pública
             filename = f"Module{index}.java" if index > 0 else "Main.java"
 
+        if self.source_path:
+            self._src_files[filename] = self.source_path / filename
         return code, filename
 
     def prepare_test_code(self, test_code: str, index: int) -> tuple[str, str]:
         """Prepara código de teste e retorna (código, nome_arquivo)."""
         # extrai o nome da classe de teste do código
-        import re
-
-        class_match = re.search(r"public\s+class\s+(\w+)", test_code)
+        class_match = _PUBLIC_CLASS.search(test_code)
         if class_match:
             class_name = class_match.group(1)
             filename = f"{class_name}.java"
@@ -94,6 +138,8 @@ class JavaAdapter(LanguageAdapter):
             # fallback se não encontrar uma classe pública
             filename = f"Module{index}Test.java" if index > 0 else "MainTest.java"
 
+        if self.tests_path:
+            self._test_files[filename] = self.tests_path / filename
         return test_code, filename
 
     def execute_tests(self) -> dict[str, Any]:
@@ -101,95 +147,114 @@ class JavaAdapter(LanguageAdapter):
         if not self.tests_path or not self.source_path or not self.project_path:
             raise RuntimeError("Project not initialized. Call init_project first.")
 
-        # cria diretório para classes compiladas
-        bin_path = self.project_path / "bin"
-        bin_path.mkdir(exist_ok=True)
-
-        # compila código fonte
-        src_files = list(self.source_path.glob("*.java"))
+        # usa os arquivos registrados na preparação; varre os diretórios
+        # apenas se nada foi registrado (ex.: reexecução de um projeto)
+        src_files = list(self._src_files.values()) or list(
+            self.source_path.glob("*.java")
+        )
         if not src_files:
             return {
                 "return_code": 1,
                 "stdout": "No source files found in src directory",
             }
-
-        # converte para caminhos relativos ao diretório do projeto
-        relative_src_files = [str(f.relative_to(self.project_path)) for f in src_files]
-
-        compile_cmd = ["javac", "-d", "bin"] + relative_src_files
-        compile_process = subprocess.run(
-            compile_cmd,
-            cwd=str(self.project_path),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
+        test_files = list(self._test_files.values()) or list(
+            self.tests_path.glob("*.java")
         )
 
-        if compile_process.returncode != 0:
-            return {
-                "return_code": compile_process.returncode,
-                "stdout": f"Compilation failed:\n{compile_process.stdout}",
-            }
-
-        # compila testes (sem dependências externas)
-        test_files = list(self.tests_path.glob("*.java"))
-        if test_files:
-            # converte para caminhos relativos ao diretório do projeto
-            relative_test_files = [
-                str(f.relative_to(self.project_path)) for f in test_files
-            ]
-
-            # compila os testes com as classes de app no classpath
-            compile_test_cmd = [
-                "javac",
-                "-cp",
-                "bin",
-                "-d",
-                "bin",
-            ] + relative_test_files
-
-            compile_test_process = subprocess.run(
-                compile_test_cmd,
-                cwd=str(self.project_path),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-            )
-
-            if compile_test_process.returncode != 0:
+        # converte para caminhos relativos ao diretório do projeto; todos os
+        # arquivos estão sob project_path, então basta remover o prefixo
+        prefix_len = len(self._project_path_str) + len(os.sep)
+        relative_src_files = [str(f)[prefix_len:] for f in src_files]
+        relative_test_files = [str(f)[prefix_len:] for f in test_files]
+
+        # o executor é compilado junto com os testes
+        if relative_test_files:
+            runner_path = self.project_path / "runner" / f"{_RUNNER_CLASS}.java"
+            runner_path.write_bytes(_RUNNER_SOURCE)
+            relative_test_files.append(str(runner_path)[prefix_len:])
+
+        if self.split_compile:
+            # compila código fonte e depois os testes, com as classes de app
+            # no classpath
+            compile_process = self._compile(relative_src_files)
+            if compile_process.returncode != 0:
                 return {
-                    "return_code": compile_test_process.returncode,
-                    "stdout": f"Test compilation failed:\n{compile_test_process.stdout}",
+                    "return_code": compile_process.returncode,
+                    "stdout": f"Compilation failed:\n{compile_process.stdout}",
                 }
 
-            # executa cada classe de teste (cada uma tem um main)
-            test_classes = [f.stem for f in test_files]
-            all_output = []
-
-            for test_class in test_classes:
-                run_test_cmd = [
-                    "java",
-                    "-cp",
-                    "bin",
-                    test_class,
-                ]
-
-                run_test_process = subprocess.run(
-                    run_test_cmd,
-                    cwd=str(self.project_path),
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                )
-
-                all_output.append(run_test_process.stdout)
-
-                if run_test_process.returncode != 0:
+            if relative_test_files:
+                compile_test_process = self._compile(relative_test_files)
+                if compile_test_process.returncode != 0:
                     return {
-                        "return_code": run_test_process.returncode,
-                        "stdout": "\n".join(all_output),
+                        "return_code": compile_test_process.returncode,
+                        "stdout": f"Test compilation failed:\n{compile_test_process.stdout}",
                     }
+        else:
+            # compila fontes e testes em uma única invocação do javac (uma JVM)
+            compile_process = self._compile(relative_src_files + relative_test_files)
+            if compile_process.returncode != 0:
+                return {
+                    "return_code": compile_process.returncode,
+                    "stdout": f"Compilation failed:\n{compile_process.stdout}",
+                }
 
-            return {"return_code": 0, "stdout": "\n".join(all_output)}
+        if not test_files:
+            return {"return_code": 0, "stdout": "No tests found"}
 
-        return {"return_code": 0, "stdout": "No tests found"}
+        # executa todas as classes de teste em uma única JVM
+        test_classes = [f.stem for f in test_files]
+        run_process = self._run_java([_RUNNER_CLASS, *test_classes])
+        if run_process.returncode != 0 or _RUNNER_DONE in run_process.stdout:
+            return {
+                "return_code": run_process.returncode,
+                "stdout": run_process.stdout,
+            }
+
+        # alguma classe encerrou a JVM (System.exit) antes do fim: executa
+        # em paralelo, uma JVM por classe, as classes que não chegaram a rodar
+        started = [
+            name for name in test_classes if f"=== {name} ===" in run_process.stdout
+        ]
+        remaining = test_classes[len(started) :]
+        all_output = [run_process.stdout]
+
+        if remaining:
+            workers = min(len(remaining), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._run_one_test_class, remaining))
+
+            # mantém a saída em ordem até a primeira classe que falhou
+            for return_code, stdout in results:
+                all_output.append(stdout)
+                if return_code != 0:
+                    return {"return_code": return_code, "stdout": "\n".join(all_output)}
+
+        return {"return_code": 0, "stdout": "\n".join(all_output)}
+
+    def _run_one_test_class(self, test_class: str) -> tuple[int, str]:
+        """Executa uma classe de teste em sua própria JVM."""
+        run_test_process = self._run_java([test_class])
+        return run_test_process.returncode, run_test_process.stdout
+
+    def _run_java(self, args: list[str]) -> subprocess.CompletedProcess:
+        """Executa a JVM com as classes compiladas em bin no classpath."""
+        run_cmd = ["java", "-cp", "bin"] + args
+        return subprocess.run(
+            run_cmd,
+            cwd=self._project_path_str,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+    def _compile(self, files: list[str]) -> subprocess.CompletedProcess:
+        """Compila os arquivos informados para o diretório bin."""
+        compile_cmd = ["javac", "-cp", "bin", "-d", "bin"] + files
+        return subprocess.run(
+            compile_cmd,
+            cwd=self._project_path_str,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
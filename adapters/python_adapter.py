@@ -1,4 +1,4 @@
-import re
+import os
 import subprocess
 import sys
 from datetime import datetime
@@ -7,14 +7,24 @@ from typing import Any
 
 from adapters.base import LanguageAdapter
 
+# linguagem aceita no bloco de código markdown da resposta da LLM
+_PYTHON_FENCE_LANGS = frozenset({"python"})
+
 
 class PythonAdapter(LanguageAdapter):
     """Adapter para projetos Python."""
 
     language = "python"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        parallel_tests: bool = True,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        # distribui os arquivos de teste entre processos com pytest-xdist
+        self.parallel_tests = parallel_tests
         self.project_path: Path | None = None
         self.source_path: Path | None = None
         self.tests_path: Path | None = None
@@ -24,16 +34,17 @@ class PythonAdapter(LanguageAdapter):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         project_name = f"project_{timestamp}"
 
-        # cria os diretórios
         self.project_path = work_dir / project_name
-        self.project_path.mkdir(parents=True, exist_ok=True)
-
         self.source_path = self.project_path / "src"
-        self.source_path.mkdir(exist_ok=True)
-
         self.tests_path = self.project_path / "tests"
+
+        # cria os diretórios; o do projeto é criado junto com o primeiro
+        self.source_path.mkdir(parents=True, exist_ok=True)
         self.tests_path.mkdir(exist_ok=True)
 
+        # caminhos em texto reutilizados nos subprocessos e no relatório
+        self._project_path_str = str(self.project_path)
+
         return {
             "project_path": self.project_path,
             "source_path": self.source_path,
@@ -43,19 +54,25 @@ class PythonAdapter(LanguageAdapter):
     def _generate_single_test(self, code: str) -> str:
         """Gera teste Python usando LLM e retorna o código como string."""
         response = self.llm.send_message(content=code)
+        return self._extract_test_code(response)
+
+    def _config_key(self) -> str:
+        return f"{super()._config_key()}:parallel_tests={self.parallel_tests}"
 
+    def _extract_test_code(self, response: Any) -> str:
+        """Extrai o código Python da resposta da LLM."""
         # busca o conteúdo de texto na resposta
         if isinstance(response, list) and len(response) > 0:
             text_content = response[0].text
         else:
             text_content = str(response)
 
-        # extrai o código
-        code_match = re.search(r"```python\n(.*?)\n```", text_content, re.DOTALL)
-        if code_match:
-            test_code = code_match.group(1)
-        else:
-            test_code = text_content
+        # resposta estruturada em JSON; markdown como alternativa
+        test_code = self._parse_json_code(text_content)
+        if test_code is None:
+            test_code = self._find_fenced_code(text_content, _PYTHON_FENCE_LANGS)
+            if test_code is None:
+                test_code = text_content
 
         return test_code
 
@@ -87,12 +104,22 @@ class PythonAdapter(LanguageAdapter):
             "pytest",
             "-q",
             "--disable-warnings",
-            "--maxfail=1",
         ]
+        # com --dist=loadfile cada arquivo roda em um único worker: mais
+        # workers que arquivos só custariam inicializações do interpretador
+        workers = 1
+        if self.parallel_tests:
+            test_files = sum(1 for _ in self.tests_path.glob("test_*.py"))
+            workers = min(test_files, os.cpu_count() or 1)
+        if workers > 1:
+            # --maxfail interromperia os workers
+            cmd += ["-n", str(workers), "--dist=loadfile"]
+        else:
+            cmd.append("--maxfail=1")
 
         process = subprocess.run(
             cmd,
-            cwd=str(self.project_path),
+            cwd=self._project_path_str,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
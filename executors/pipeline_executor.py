@@ -1,53 +1,181 @@
+import asyncio
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from adapters.base import LanguageAdapter
 
+logger = logging.getLogger(__name__)
+
+# threads que gravam os arquivos gerados enquanto a LLM responde
+_MAX_WRITE_WORKERS = 8
+
+# prólogo do relatório, já codificado
+_XML_PROLOG = b'<?xml version="1.0" encoding="utf-8"?>\n'
+
+# identifica as entradas da última execução concluída em work_dir
+_STAMP_FILE = ".pipeline_stamp"
+
 
 class PipelineExecutor:
     def __init__(
         self,
         language_adapter: LanguageAdapter,
         work_dir: Path,
+        skip_unchanged: bool = True,
     ) -> None:
         self.adapter = language_adapter
         self.work_dir = work_dir
+        # pula a execução se as entradas forem iguais às da última concluída
+        self.skip_unchanged = skip_unchanged
 
     def execute(self, input_code: str | list[str]):
         """Executa o pipeline completo: inicializa projeto, gera testes, executa e gera relatório."""
+        return asyncio.run(self._aexecute_and_close(input_code))
+
+    async def _aexecute_and_close(self, input_code: str | list[str]):
+        """Executa o pipeline e fecha as conexões da LLM do event loop próprio."""
+        try:
+            return await self.aexecute(input_code)
+        finally:
+            await self.adapter.llm.aclose()
+
+    async def aexecute(self, input_code: str | list[str]):
+        """Versão assíncrona de execute, para uso dentro de um event loop (ex.: Jupyter).
+
+        As conexões da LLM ficam abertas no event loop do chamador, que pode
+        ser compartilhado com outros pipelines; feche-as com
+        `await llm.aclose()` quando não houver mais requisições no loop.
+        """
+        codes = input_code if isinstance(input_code, list) else [input_code]
+        stamp_path = self.work_dir / _STAMP_FILE
+        key = self._inputs_key(codes)
+        if self.skip_unchanged:
+            previous_report = _read_stamp(stamp_path, key)
+            if previous_report is not None:
+                logger.info(
+                    "Entrada inalterada; relatório existente em %s", previous_report
+                )
+                return
+        # a execução anterior deixa de valer enquanto esta não termina
+        stamp_path.unlink(missing_ok=True)
+
         # inicializa estrutura do projeto
         paths = self.adapter.init_project(self.work_dir)
-        project_path = paths["project_path"]
-        source_path = paths["source_path"]
-        tests_path = paths["tests_path"]
+        try:
+            project_path = paths["project_path"]
+            source_path = paths["source_path"]
+            tests_path = paths["tests_path"]
 
-        # grava o código de input
-        codes = input_code if isinstance(input_code, list) else [input_code]
-        for i, code in enumerate(codes):
-            prepared_code, filename = self.adapter.prepare_source_code(code, i)
-            with open(source_path / filename, "w") as f:
-                f.write(prepared_code)
-
-        # gera os testes (retorna strings de código)
-        test_codes = self.adapter.generate_tests(input_code)
-
-        # grava os arquivos de teste
-        test_codes_list = test_codes if isinstance(test_codes, list) else [test_codes]
-        for i, test_code in enumerate(test_codes_list):
-            prepared_test, filename = self.adapter.prepare_test_code(test_code, i)
-            test_file_path = tests_path / filename
-            with open(test_file_path, "w") as f:
-                f.write(prepared_test)
-            print(f"Arquivo de teste gerado em {test_file_path}")
-
-        # executa os testes
-        test_results = self.adapter.execute_tests()
-
-        # gera o relatório (retorna string XML)
-        report_xml = self.adapter.generate_report(test_results)
-
-        # grava o arquivo de relatório
-        report_path = project_path / "test_report.xml"
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-            f.write(report_xml)
-        print(f"Arquivo de relatório gerado em {report_path}")
+            prepared = [
+                self.adapter.prepare_source_code(code, i)
+                for i, code in enumerate(codes)
+            ]
+            source_files = [(source_path / name, code) for code, name in prepared]
+
+            loop = asyncio.get_running_loop()
+            test_files: list[tuple[Path, str] | None] = [None] * len(codes)
+            with ThreadPoolExecutor(max_workers=_MAX_WRITE_WORKERS) as executor:
+                # grava o código de input enquanto a LLM gera os testes
+                writes = [
+                    loop.run_in_executor(executor, _write_file, path, content)
+                    for path, content in source_files
+                ]
+
+                # grava cada teste assim que fica pronto, sem esperar os demais
+                async for i, test_code in self.adapter.agenerate_tests_stream(codes):
+                    prepared_test, filename = self.adapter.prepare_test_code(
+                        test_code, i
+                    )
+                    test_files[i] = (tests_path / filename, prepared_test)
+                    writes.append(
+                        loop.run_in_executor(executor, _write_file, *test_files[i])
+                    )
+                await asyncio.gather(*writes)
+
+            for test_file_path, _ in test_files:
+                logger.info("Arquivo de teste gerado em %s", test_file_path)
+
+            # executa os testes
+            test_results = await self.adapter.execute_tests_async()
+
+            # gera o relatório (retorna string XML)
+            report_xml = self.adapter.generate_report(test_results)
+
+            # grava o arquivo de relatório
+            report_path = project_path / "test_report.xml"
+            _write_buffers(report_path, [_XML_PROLOG, report_xml.encode("utf-8")])
+            logger.info("Arquivo de relatório gerado em %s", report_path)
+
+            # só uma execução bem-sucedida é reaproveitada: falhas de ambiente
+            # (restore, compilação, pytest ausente) devem ser tentadas de novo
+            if test_results["return_code"] == 0:
+                _write_stamp(stamp_path, key, report_path)
+        finally:
+            # libera processos auxiliares do adapter (ex.: restore em segundo
+            # plano) mesmo se a geração falhar ou for cancelada
+            self.adapter.cleanup()
+
+    def _inputs_key(self, codes: list[str]) -> str:
+        """Chave das entradas: linguagem, configuração do adapter, parâmetros
+        da LLM e códigos.
+        """
+        llm = self.adapter.llm
+        parts = [
+            self.adapter.language,
+            self.adapter._config_key(),
+            llm.model,
+            llm.system or "",
+            str(llm.max_tokens),
+            str(llm.temperature),
+            *codes,
+        ]
+        return hashlib.blake2b(
+            "\x00".join(parts).encode("utf-8"), digest_size=16
+        ).hexdigest()
+
+
+def _write_file(path: Path, content: str) -> None:
+    """Grava o conteúdo em UTF-8 diretamente no descritor do arquivo."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        data = memoryview(content.encode("utf-8"))
+        while data:
+            data = data[os.write(fd, data) :]
+    finally:
+        os.close(fd)
+
+
+def _read_stamp(stamp_path: Path, key: str) -> Path | None:
+    """Retorna o relatório da última execução se ela teve a mesma chave."""
+    try:
+        stored_key, report = stamp_path.read_text(encoding="utf-8").split("\n", 1)
+    except (OSError, ValueError):
+        return None
+    report_path = Path(report)
+    if stored_key != key or not report_path.is_file():
+        return None
+    return report_path
+
+
+def _write_stamp(stamp_path: Path, key: str, report_path: Path) -> None:
+    """Grava o carimbo de forma atômica (arquivo temporário + rename)."""
+    tmp_path = stamp_path.with_name(stamp_path.name + ".tmp")
+    _write_file(tmp_path, f"{key}\n{report_path}")
+    os.replace(tmp_path, stamp_path)
+
+
+def _write_buffers(path: Path, buffers: list[bytes]) -> None:
+    """Grava os buffers em sequência com uma única chamada writev."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.writev(fd, buffers)
+        # escrita parcial (rara em arquivos regulares): grava o restante
+        if written < sum(map(len, buffers)):
+            rest = memoryview(b"".join(buffers))[written:]
+            while rest:
+                rest = rest[os.write(fd, rest) :]
+    finally:
+        os.close(fd)
@@ -0,0 +1,53 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class LLMCache:
+    """Persistent exact-match cache for processed LLM responses.
+
+    Entries are stored in a SQLite database inside `cache_dir`, keyed by a
+    SHA-256 digest of the request parameters (see `make_key`).
+    """
+
+    def __init__(self, cache_dir: Path):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / "llm_cache.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts: Optional[str]) -> str:
+        """Build a cache key from the given request parameters."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        """Store `value` under `key`, replacing any previous entry."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
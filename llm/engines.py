@@ -1,11 +1,40 @@
+import asyncio
+import atexit
+import functools
+import json
 import os
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
 
-from anthropic import Anthropic
-from dotenv import load_dotenv
+from llm.cache import LLMCache
+from llm.prompts import marshaled_batch_instructions
 
-load_dotenv()
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+    from anthropic.types import TextBlock
+
+# minimum batch size sent through the Message Batches API when enabled
+_OFFLINE_BATCH_THRESHOLD = 8
+# seconds between status checks of a submitted message batch
+_BATCH_POLL_INTERVAL = 10.0
+
+# limits of a marshaled request (several inputs in one prompt): inputs per
+# request, input characters per request (about half of a 200k-token context
+# window at ~4 chars/token) and default output tokens per request
+_MARSHAL_GROUP_SIZE = 10
+_MARSHAL_MAX_CHARS = 400_000
+_MARSHAL_MAX_TOKENS = 32000
+
+# retries of a failed request before the error reaches the caller
+_MAX_RETRIES = 5
+
+# decodes a JSON value embedded in prose (raw_decode)
+_JSON_DECODER = json.JSONDecoder()
+
+# responses are only cached for (near-)deterministic sampling
+_CACHE_MAX_TEMPERATURE = 0.2
 
 
 class LLMEngine(ABC):
@@ -17,17 +46,135 @@ class LLMEngine(ABC):
         max_tokens: int = 1024,
         temperature: float = 0.7,
         system: Optional[str] = None,
+        max_concurrency: int = 10,
+        marshal_max_tokens: int = _MARSHAL_MAX_TOKENS,
     ):
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.system = system
+        self.max_concurrency = max_concurrency
+        # output token cap of a marshaled request; keep it within the model's
+        # output limit
+        self.marshal_max_tokens = marshal_max_tokens
+        self._semaphore: asyncio.Semaphore | None = None
+        self._semaphore_loop: asyncio.AbstractEventLoop | None = None
 
     @abstractmethod
     def send_message(self, content: str) -> Any:
         """Send a message to the LLM and return the response."""
         pass
 
+    async def send_message_async(self, content: str) -> Any:
+        """Send a message to the LLM without blocking the event loop.
+
+        Engines without a native async client fall back to running
+        `send_message` in a worker thread.
+        """
+        async with self._concurrency_limit():
+            return await asyncio.to_thread(self.send_message, content)
+
+    async def send_batch_async(self, contents: list[str]) -> list[Any]:
+        """Send several messages concurrently and return the responses in order.
+
+        At most `max_concurrency` requests are in flight at a time.
+        """
+        return await asyncio.gather(
+            *(self.send_message_async(content) for content in contents)
+        )
+
+    def send_batch(self, contents: list[str]) -> list[Any]:
+        """Blocking wrapper around `send_batch_async` for synchronous callers."""
+        return self._run_and_close(self.send_batch_async(contents))
+
+    async def aclose(self) -> None:
+        """Release connections held for the running event loop.
+
+        The pool is shared by every engine on the loop, so call this only
+        once all of the loop's LLM work is done (the blocking wrappers do so
+        for the loop they create). The engine reconnects if it is used again.
+        The default implementation holds no connections.
+        """
+
+    def _run_and_close(self, coro: Any) -> Any:
+        """Run `coro` in a new event loop, then release its connections."""
+
+        async def main():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+
+        return asyncio.run(main())
+
+    async def send_marshaled_async(self, contents: list[str]) -> list[Optional[str]]:
+        """Send several inputs per request and split each reply per input.
+
+        Inputs are grouped by count and size; groups are sent concurrently,
+        each as one prompt asking for a JSON array with one answer per input.
+        Returns each input's answer as text (JSON-encoded unless the model
+        answered with a plain string), or None where the reply has none or
+        the group's request was rejected.
+        """
+        groups: list[list[str]] = []
+        group_chars = 0
+        for content in contents:
+            if (
+                not groups
+                or len(groups[-1]) >= _MARSHAL_GROUP_SIZE
+                or group_chars + len(content) > _MARSHAL_MAX_CHARS
+            ):
+                groups.append([])
+                group_chars = 0
+            groups[-1].append(content)
+            group_chars += len(content)
+
+        replies = await asyncio.gather(*(self._send_marshaled(g) for g in groups))
+        return [answer for group_replies in replies for answer in group_replies]
+
+    async def _send_marshaled(self, contents: list[str]) -> list[Optional[str]]:
+        blocks = "\n\n".join(
+            f'<block id="{i}">\n{content}\n</block>'
+            for i, content in enumerate(contents)
+        )
+        prompt = marshaled_batch_instructions.format(count=len(contents)) + blocks
+        max_tokens = min(self.max_tokens * len(contents), self.marshal_max_tokens)
+        chunks = [chunk async for chunk in self.stream_message(prompt, max_tokens)]
+        return _split_marshaled("".join(chunks), len(contents))
+
+    def prefers_offline_batch(self, count: int) -> bool:
+        """Whether `send_batch_async` would send `count` messages as one
+        offline batch, whose responses only arrive once the whole batch ends.
+        """
+        return False
+
+    def _concurrency_limit(self) -> asyncio.Semaphore:
+        """Semaphore bounding in-flight requests on the running event loop.
+
+        Like the async client, it is recreated when the loop changes.
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def stream_message(
+        self, content: str, max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Stream the LLM response as text chunks.
+
+        `max_tokens` overrides the engine default for this call where the
+        engine supports it. The default implementation ignores it and yields
+        the complete response as a single chunk once `send_message_async`
+        returns.
+        """
+        response = await self.send_message_async(content)
+        if isinstance(response, list) and len(response) > 0:
+            yield response[0].text
+        else:
+            yield str(response)
+
 
 class AnthropicEngine(LLMEngine):
     def __init__(
@@ -36,19 +183,290 @@ class AnthropicEngine(LLMEngine):
         max_tokens=1024,
         temperature=0.1,
         system=None,
+        max_concurrency=10,
+        prefer_offline_batch=False,
+        offline_batch_threshold=_OFFLINE_BATCH_THRESHOLD,
+        max_retries=_MAX_RETRIES,
+        marshal_max_tokens=_MARSHAL_MAX_TOKENS,
     ):
-        super().__init__(model, max_tokens, temperature, system)
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        super().__init__(
+            model,
+            max_tokens,
+            temperature,
+            system,
+            max_concurrency,
+            marshal_max_tokens=marshal_max_tokens,
+        )
+        # send large batches through the Message Batches API (cheaper, but
+        # results may take minutes to hours) instead of concurrent requests
+        self.prefer_offline_batch = prefer_offline_batch
+        self.offline_batch_threshold = offline_batch_threshold
+        # request fields shared by every call, built once
+        self._kwargs_template: dict[str, Any] = {
+            "max_tokens": max_tokens,
+            "model": model,
+            "temperature": temperature,
+        }
+        if system:
+            # system prompt as a cacheable block: repeated requests reuse it
+            self._kwargs_template["system"] = [
+                {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+            ]
+        _load_env()
+        # the SDK (httpx, pydantic, ...) is only imported once an engine is
+        # created, keeping it out of the import of adapters and executors
+        from anthropic import Anthropic
 
-    def send_message(self, content: str):
+        # on-disk response cache; LLM_CACHE_DIR="" disables it
+        cache_dir = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+        self.cache = (
+            LLMCache(Path(cache_dir))
+            if cache_dir and temperature <= _CACHE_MAX_TEMPERATURE
+            else None
+        )
+        # the SDK retries rate limits (429), overloads/5xx, timeouts and
+        # connection errors with exponential backoff and jitter, honouring
+        # Retry-After when the API sends it
+        self.max_retries = max_retries
+        self.api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.client = Anthropic(
+            api_key=self.api_key,
+            http_client=_shared_http_client(),
+            max_retries=max_retries,
+        )
+        self._async_client: "AsyncAnthropic | None" = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+        self._async_http_client: Any = None
+
+    @property
+    def async_client(self) -> "AsyncAnthropic":
+        """Async client bound to the running event loop.
+
+        The underlying connection pool cannot outlive its loop, so a new
+        client is created whenever the engine is used from a different loop
+        (e.g. successive `asyncio.run` calls). Engines on the same loop share
+        one pool until `aclose` closes it.
+        """
+        loop = asyncio.get_running_loop()
+        http_client = _shared_async_http_client(loop)
+        if (
+            self._async_client is None
+            or self._async_loop is not loop
+            or self._async_http_client is not http_client
+        ):
+            from anthropic import AsyncAnthropic
+
+            self._async_client = AsyncAnthropic(
+                api_key=self.api_key,
+                http_client=http_client,
+                max_retries=self.max_retries,
+            )
+            self._async_loop = loop
+            self._async_http_client = http_client
+        return self._async_client
+
+    async def aclose(self) -> None:
+        self._async_client = None
+        self._async_loop = None
+        self._async_http_client = None
+        await _close_async_http_client(asyncio.get_running_loop())
+
+    def _build_kwargs(
+        self, content: str, max_tokens: Optional[int] = None
+    ) -> dict[str, Any]:
         kwargs = {
-            "max_tokens": self.max_tokens,
+            **self._kwargs_template,
             "messages": [{"role": "user", "content": content}],
-            "model": self.model,
-            "temperature": self.temperature,
         }
-        if self.system:
-            kwargs["system"] = self.system
+        if max_tokens:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
+
+    def _cache_key(self, content: str, max_tokens: Optional[int] = None) -> str:
+        return LLMCache.make_key(
+            self.model,
+            self.system,
+            str(max_tokens or self.max_tokens),
+            str(self.temperature),
+            content,
+        )
+
+    def _cache_get(self, key: str) -> Optional[list["TextBlock"]]:
+        """Return a cached response shaped like `message.content`, if any."""
+        if self.cache is None:
+            return None
+        text = self.cache.get(key)
+        if text is None:
+            return None
+        from anthropic.types import TextBlock
 
-        message = self.client.messages.create(**kwargs)
+        return [TextBlock(type="text", text=text)]
+
+    def _cache_set(self, key: str, message: Any) -> None:
+        # truncated responses are not cached
+        if self.cache is not None and message.stop_reason != "max_tokens":
+            text = "".join(b.text for b in message.content if b.type == "text")
+            self.cache.set(key, text)
+
+    def send_message(self, content: str):
+        key = self._cache_key(content)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        message = self.client.messages.create(**self._build_kwargs(content))
+        self._cache_set(key, message)
+        return message.content
+
+    async def send_message_async(self, content: str):
+        key = self._cache_key(content)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        async with self._concurrency_limit():
+            message = await self.async_client.messages.create(
+                **self._build_kwargs(content)
+            )
+        self._cache_set(key, message)
         return message.content
+
+    async def stream_message(
+        self, content: str, max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        key = self._cache_key(content, max_tokens)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached[0].text
+            return
+        async with self._concurrency_limit():
+            async with self.async_client.messages.stream(
+                **self._build_kwargs(content, max_tokens)
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                self._cache_set(key, await stream.get_final_message())
+
+    async def _send_marshaled(self, contents: list[str]) -> list[Optional[str]]:
+        from anthropic import APIStatusError
+
+        try:
+            return await super()._send_marshaled(contents)
+        except APIStatusError:
+            # e.g. the grouped request exceeds the model's limits: leave every
+            # input unanswered so callers fall back to one request per input
+            return [None] * len(contents)
+
+    def prefers_offline_batch(self, count: int) -> bool:
+        return self.prefer_offline_batch and count >= self.offline_batch_threshold
+
+    async def send_batch_async(self, contents: list[str]) -> list[Any]:
+        if self.prefers_offline_batch(len(contents)):
+            return await self.send_batch_api_async(contents)
+        return await super().send_batch_async(contents)
+
+    async def send_batch_api_async(self, contents: list[str]) -> list[Any]:
+        """Send the messages as one Message Batch and wait for its results.
+
+        Results are matched back to `contents` by `custom_id`. Requests that
+        did not succeed in the batch are retried individually.
+        """
+        keys = [self._cache_key(content) for content in contents]
+        responses: list[Any] = [self._cache_get(key) for key in keys]
+        pending = [i for i, response in enumerate(responses) if response is None]
+        if not pending:
+            return responses
+
+        batches = self.async_client.messages.batches
+        batch = await batches.create(
+            requests=[
+                {"custom_id": f"req-{i}", "params": self._build_kwargs(contents[i])}
+                for i in pending
+            ]
+        )
+        while batch.processing_status != "ended":
+            await asyncio.sleep(_BATCH_POLL_INTERVAL)
+            batch = await batches.retrieve(batch.id)
+
+        async for entry in await batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                i = int(entry.custom_id.removeprefix("req-"))
+                responses[i] = entry.result.message.content
+                self._cache_set(keys[i], entry.result.message)
+
+        missing = [i for i, response in enumerate(responses) if response is None]
+        retried = await super().send_batch_async([contents[i] for i in missing])
+        for i, response in zip(missing, retried):
+            responses[i] = response
+        return responses
+
+    def send_batch_api(self, contents: list[str]) -> list[Any]:
+        """Blocking wrapper around `send_batch_api_async`."""
+        return self._run_and_close(self.send_batch_api_async(contents))
+
+
+def _split_marshaled(text: str, count: int) -> list[Optional[str]]:
+    """Split a marshaled reply (a JSON array) into `count` answers.
+
+    The array may be surrounded by prose: one is decoded from each "[" until
+    a list of answers (objects, strings or nulls) is found.
+    """
+    items: list[Any] = []
+    start = text.find("[")
+    while start >= 0:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, start)
+        except ValueError:
+            pass
+        else:
+            if isinstance(value, list) and all(
+                item is None or isinstance(item, (str, dict)) for item in value
+            ):
+                items = value
+                break
+        start = text.find("[", start + 1)
+
+    answers = [
+        item if isinstance(item, str) or item is None else json.dumps(item)
+        for item in items[:count]
+    ]
+    return answers + [None] * (count - len(answers))
+
+
+# async connection pools shared by all engines, one per event loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@functools.cache
+def _shared_http_client():
+    """httpx client shared by every engine, so they reuse one connection pool."""
+    from anthropic import DefaultHttpxClient
+
+    client = DefaultHttpxClient()
+    atexit.register(client.close)
+    return client
+
+
+def _shared_async_http_client(loop: asyncio.AbstractEventLoop):
+    """Async httpx client shared by every engine running on `loop`."""
+    client = _async_http_clients.get(loop)
+    if client is None:
+        from anthropic import DefaultAsyncHttpxClient
+
+        client = _async_http_clients[loop] = DefaultAsyncHttpxClient()
+    return client
+
+
+async def _close_async_http_client(loop: asyncio.AbstractEventLoop) -> None:
+    """Close the pool shared on `loop`; the next request on it opens a new one."""
+    client = _async_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+@functools.cache
+def _load_env() -> None:
+    """Load `.env` into the environment once, on first engine creation."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
@@ -1,3 +1,6 @@
+import logging
+import sys
+from logging.handlers import MemoryHandler
 from pathlib import Path
 
 from adapters import CsAdapter, JavaAdapter, PythonAdapter
@@ -9,36 +12,68 @@ from llm.prompts import (
     python_unit_test_generator,
 )
 
+logger = logging.getLogger(__name__)
+
+
+class BufferedLogHandler(MemoryHandler):
+    """MemoryHandler that writes the buffered records with a single write."""
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.buffer and isinstance(self.target, logging.StreamHandler):
+                self.target.stream.write(
+                    "".join(
+                        self.target.format(record) + self.target.terminator
+                        for record in self.buffer
+                    )
+                )
+                self.target.flush()
+                self.buffer.clear()
+                return
+        super().flush()
+
+
+def configure_logging() -> MemoryHandler:
+    target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    handler = BufferedLogHandler(capacity=100, flushLevel=logging.ERROR, target=target)
+    # INFO only for the project's loggers; libraries (e.g. httpx, which logs
+    # every request at INFO) stay at the default WARNING level
+    logging.basicConfig(handlers=[handler])
+    for name in ("executors", logger.name):
+        logging.getLogger(name).setLevel(logging.INFO)
+    return handler
+
 
 def main():
-    # print("=" * 50)
-    # print("Testing Python with single string")
-    # print("=" * 50)
+    # logger.info("=" * 50)
+    # logger.info("Testing Python with single string")
+    # logger.info("=" * 50)
     # run_python_pipeline()
 
-    # print("\n" + "=" * 50)
-    # print("Testing Python with list of strings (async)")
-    # print("=" * 50)
+    # logger.info("\n" + "=" * 50)
+    # logger.info("Testing Python with list of strings (async)")
+    # logger.info("=" * 50)
     # run_python_pipeline_batch()
 
-    # print("\n" + "=" * 50)
-    # print("Testing C# with single string")
-    # print("=" * 50)
+    # logger.info("\n" + "=" * 50)
+    # logger.info("Testing C# with single string")
+    # logger.info("=" * 50)
     # run_cs_pipeline()
 
-    # print("\n" + "=" * 50)
-    # print("Testing C# with list of strings (async)")
-    # print("=" * 50)
+    # logger.info("\n" + "=" * 50)
+    # logger.info("Testing C# with list of strings (async)")
+    # logger.info("=" * 50)
     # run_cs_pipeline_batch()
 
-    # print("\n" + "=" * 50)
-    # print("Testing Java with single string")
-    # print("=" * 50)
+    # logger.info("\n" + "=" * 50)
+    # logger.info("Testing Java with single string")
+    # logger.info("=" * 50)
     # run_java_pipeline()
 
-    print("\n" + "=" * 50)
-    print("Testing Java with list of strings (async)")
-    print("=" * 50)
+    logger.info("\n" + "=" * 50)
+    logger.info("Testing Java with list of strings (async)")
+    logger.info("=" * 50)
     run_java_pipeline_batch()
 
 
@@ -232,4 +267,8 @@ def run_java_pipeline_batch():
 
 
 if __name__ == "__main__":
-    main()
+    log_handler = configure_logging()
+    try:
+        main()
+    finally:
+        log_handler.flush()